@@ -1,9 +1,5 @@
 import sys
 import os
-import sqlite3
-import secrets
-import logging
-from datetime import datetime, timedelta
 
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QFrame,
@@ -11,146 +7,82 @@ from PyQt5.QtWidgets import (
     QSizePolicy
 )
 from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QFont, QPixmap
-from cryptography.fernet import Fernet
-
-# -------------------------------------------------------------------
-#                     Minimal Ledger Backend
-# -------------------------------------------------------------------
-class LedgerBackend:
-    """
-    Basic credential storage + password reset in SQLite,
-    with encryption via Fernet.
-    """
-    def __init__(self, db_path="secure_ledger.db"):
-        logging.basicConfig(level=logging.INFO)
-        self.logger = logging.getLogger("LedgerBackend")
-
-        # For production, store the key somewhere safer than in-memory!
-        self.key = Fernet.generate_key()
-        self.cipher_suite = Fernet(self.key)
-        self.db_path = db_path
-
-        self.setup_database()
-
-    def setup_database(self):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS user_credentials (
-                user_id TEXT PRIMARY KEY,
-                encrypted_username TEXT,
-                encrypted_password TEXT,
-                hint TEXT,
-                biometric_enabled BOOLEAN
-            )
-        ''')
-        conn.commit()
-        conn.close()
-        self.logger.info("Database setup complete.")
-
-    def store_credentials(self, user_id, username, password, hint=""):
-        """
-        Insert or replace a user’s credentials (encrypted).
-        """
-        enc_username = self.cipher_suite.encrypt(username.encode("utf-8"))
-        enc_password = self.cipher_suite.encrypt(password.encode("utf-8"))
-
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('''
-            INSERT OR REPLACE INTO user_credentials (
-                user_id, encrypted_username, encrypted_password, hint, biometric_enabled
-            ) VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, enc_username, enc_password, hint, False))
-        conn.commit()
-        conn.close()
-        self.logger.info(f"Stored credentials for user: {user_id}")
-
-    def retrieve_credentials(self, user_id):
-        """
-        Return {username, password, hint, biometric_enabled} or None if not found.
-        """
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('''
-            SELECT encrypted_username, encrypted_password, hint, biometric_enabled
-            FROM user_credentials WHERE user_id=?
-        ''', (user_id,))
-        row = c.fetchone()
-        conn.close()
-
-        if not row:
-            return None
-
-        dec_username = self.cipher_suite.decrypt(row[0]).decode("utf-8")
-        dec_password = self.cipher_suite.decrypt(row[1]).decode("utf-8")
-
-        return {
-            "username": dec_username,
-            "password": dec_password,
-            "hint": row[2],
-            "biometric_enabled": row[3]
-        }
-
-    def reset_password(self, user_id):
-        """
-        Generate a reset token/expiry and store it in 'hint' for demo.
-        """
-        # Check if user exists first
-        creds = self.retrieve_credentials(user_id)
-        if not creds:
-            self.logger.warning(f"No user found for {user_id}")
-            return None
-
-        try:
-            reset_token = secrets.token_urlsafe(32)
-            expiry = datetime.now() + timedelta(hours=24)
-
-            conn = sqlite3.connect(self.db_path)
-            c = conn.cursor()
-            c.execute('''
-                UPDATE user_credentials
-                SET hint=?
-                WHERE user_id=?
-            ''', (f"{reset_token}|{expiry}", user_id))
-            conn.commit()
-            conn.close()
-
-            return {"token": reset_token, "expiry": expiry}
-        except Exception as e:
-            self.logger.error(f"Password reset failed: {e}")
-            return None
-
-    def verify_reset_token(self, user_id, token):
-        """
-        Example usage, not integrated in the UI above:
-        Check if a stored token matches and not expired.
-        """
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('''
-            SELECT hint FROM user_credentials WHERE user_id=?
-        ''', (user_id,))
-        row = c.fetchone()
-        conn.close()
-
-        if not row or not row[0]:
-            return False
-
-        stored_hint = row[0]
-        if '|' not in stored_hint:
-            return False
-
-        stored_token, expiry_str = stored_hint.split('|', 1)
-        try:
-            expiry_time = datetime.fromisoformat(expiry_str)
-        except ValueError:
-            return False
-
-        if token == stored_token and datetime.now() < expiry_time:
-            return True
-        return False
+from PyQt5.QtGui import QFont, QPixmap, QPixmapCache, QPalette, QBrush, QColor, QPainter
+
+from ledger_backend import LedgerBackend, get_backend
+
+# Parsed by Qt once per window; kept as a constant so it is built only once.
+_STYLE_SHEET = """
+    QWidget {
+        color: #ffffff;
+        font-family: Arial, sans-serif;
+        font-size: 24px;
+    }
+
+    /* Not the background frame itself, so its palette shows through */
+    #BackgroundFrame QWidget, QDialog, QDialog QWidget {
+        background-color: transparent;
+    }
+
+    QLabel#titleLabel {
+        font-size: 50px;
+        font-weight: bold;
+    }
+
+    QLineEdit#loginField {
+        background-color: #ffffff;
+        color: #000000;
+        border: 2px solid #cccccc;
+        border-radius: 8px;
+        padding: 10px;
+        font-size: 22px;
+    }
+    QLineEdit#loginField:focus {
+        border: 2px solid #ffcc00;
+    }
+
+    QPushButton {
+        border: none;
+        border-radius: 8px;
+        margin: 0px;
+        padding: 15px 20px;
+    }
+    QPushButton#mainButton {
+        background-color: #2ecc71;
+        color: #ffffff;
+        font-size: 26px;
+    }
+    QPushButton#mainButton:hover {
+        background-color: #27ae60;
+    }
+    QPushButton#mainButton:pressed {
+        background-color: #1e8449;
+    }
+
+    QPushButton#secondaryButton {
+        background-color: #3498db;
+        color: #ffffff;
+        font-size: 24px;
+    }
+    QPushButton#secondaryButton:hover {
+        background-color: #2980b9;
+    }
+    QPushButton#secondaryButton:pressed {
+        background-color: #1f5a7e;
+    }
+
+    QPushButton#exitButton {
+        background-color: #e74c3c;
+        color: #ffffff;
+        font-size: 24px;
+    }
+    QPushButton#exitButton:hover {
+        background-color: #c0392b;
+    }
+    QPushButton#exitButton:pressed {
+        background-color: #962d22;
+    }
+"""
 
 
 # -------------------------------------------------------------------
@@ -164,6 +96,11 @@ class MyChartLedgerKiosk(QWidget):
      - Fullscreen mode (press Esc or click "Exit Fullscreen" to leave).
      - Large text, user-friendly for seniors.
     """
+    # Decoded/scaled images are shared by every kiosk window in the process.
+    _LOGO_CACHE = None
+    _EXPAND_FIXED = QSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+    BACKGROUND_COLOR = "#002f55"  # fallback color if image fails
+
     def __init__(self, backend: LedgerBackend):
         super().__init__()
         self.backend = backend
@@ -199,11 +136,9 @@ class MyChartLedgerKiosk(QWidget):
 
         self.logo_label = QLabel()
         # Load the logo, if it fails, no crash—just no pixmap
-        logo_pix = QPixmap(self.LOGO_IMAGE_PATH)
+        logo_pix = self._logo_pixmap(self.LOGO_IMAGE_PATH)
         if not logo_pix.isNull():
-            # scale to a decent size
-            scaled_logo = logo_pix.scaled(200, 200, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            self.logo_label.setPixmap(scaled_logo)
+            self.logo_label.setPixmap(logo_pix)
 
         top_row.addWidget(self.logo_label, alignment=Qt.AlignLeft | Qt.AlignVCenter)
 
@@ -277,88 +212,62 @@ class MyChartLedgerKiosk(QWidget):
         main_layout.addWidget(self.bg_frame)
         self.setLayout(main_layout)
 
-    def apply_styles(self):
+    @classmethod
+    def _logo_pixmap(cls, path):
+        """
+        Decode and scale the logo once; it is always shown at the same size.
+        """
+        if cls._LOGO_CACHE is None:
+            logo_pix = QPixmap(path)
+            if not logo_pix.isNull():
+                # scale to a decent size
+                logo_pix = logo_pix.scaled(200, 200, Qt.KeepAspectRatio, Qt.FastTransformation)
+            cls._LOGO_CACHE = logo_pix
+        return cls._LOGO_CACHE
+
+    @staticmethod
+    def _background_pixmap(path):
+        """
+        Decoded background image, kept in QPixmapCache so it is read once.
         """
-        Style sheet referencing the background and setting fonts/colors.
+        bg_pix = QPixmapCache.find(path)
+        if bg_pix is None:
+            bg_pix = QPixmap(path)
+            QPixmapCache.insert(path, bg_pix)
+        return bg_pix
+
+    def _update_background(self):
+        """
+        Paint the background frame through its palette: the fallback color with
+        the cached image centered on top (no repeat), sized to the window.
+        """
+        canvas = QPixmap(self.size())
+        canvas.fill(QColor(self.BACKGROUND_COLOR))
+        bg_pix = self._background_pixmap(self.BACKGROUND_IMAGE_PATH)
+        if not bg_pix.isNull():
+            painter = QPainter(canvas)
+            painter.drawPixmap(
+                (canvas.width() - bg_pix.width()) // 2,
+                (canvas.height() - bg_pix.height()) // 2,
+                bg_pix
+            )
+            painter.end()
+
+        pal = self.bg_frame.palette()
+        pal.setBrush(QPalette.Window, QBrush(canvas))
+        self.bg_frame.setPalette(pal)
+        self.bg_frame.setAutoFillBackground(True)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._update_background()
+
+    def apply_styles(self):
         """
-        # Convert path to forward slashes for Qt
-        bg_path = self.BACKGROUND_IMAGE_PATH.replace("\\","/")
-        style_sheet = f"""
-            #BackgroundFrame {{
-                background-image: url('{bg_path}');
-                background-repeat: no-repeat;
-                background-position: center;
-                background-attachment: fixed;
-                background-color: #002f55; /* fallback color if image fails */
-            }}
-
-            QWidget {{
-                color: #ffffff;
-                font-family: Arial, sans-serif;
-                font-size: 24px;
-                background-color: transparent;
-            }}
-
-            QLabel#titleLabel {{
-                font-size: 50px;
-                font-weight: bold;
-            }}
-
-            QLineEdit#loginField {{
-                background-color: #ffffff;
-                color: #000000;
-                border: 2px solid #cccccc;
-                border-radius: 8px;
-                padding: 10px;
-                font-size: 22px;
-            }}
-            QLineEdit#loginField:focus {{
-                border: 2px solid #ffcc00;
-            }}
-
-            QPushButton {{
-                border: none;
-                border-radius: 8px;
-                margin: 0px;
-                padding: 15px 20px;
-            }}
-            QPushButton#mainButton {{
-                background-color: #2ecc71;
-                color: #ffffff;
-                font-size: 26px;
-            }}
-            QPushButton#mainButton:hover {{
-                background-color: #27ae60;
-            }}
-            QPushButton#mainButton:pressed {{
-                background-color: #1e8449;
-            }}
-
-            QPushButton#secondaryButton {{
-                background-color: #3498db;
-                color: #ffffff;
-                font-size: 24px;
-            }}
-            QPushButton#secondaryButton:hover {{
-                background-color: #2980b9;
-            }}
-            QPushButton#secondaryButton:pressed {{
-                background-color: #1f5a7e;
-            }}
-
-            QPushButton#exitButton {{
-                background-color: #e74c3c;
-                color: #ffffff;
-                font-size: 24px;
-            }}
-            QPushButton#exitButton:hover {{
-                background-color: #c0392b;
-            }}
-            QPushButton#exitButton:pressed {{
-                background-color: #962d22;
-            }}
+        Style sheet setting fonts/colors. The background image is not in here:
+        it is painted through the frame's palette (see _update_background).
         """
-        self.setStyleSheet(style_sheet)
+        self.setStyleSheet(_STYLE_SHEET)
 
     # Press Esc to exit fullscreen
     def keyPressEvent(self, event):
@@ -370,8 +279,7 @@ class MyChartLedgerKiosk(QWidget):
 
     # Utility: Make widget expand horizontally, with a fixed min height
     def _make_expanding(self, widget, min_height=60):
-        size_policy = QSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
-        widget.setSizePolicy(size_policy)
+        widget.setSizePolicy(self._EXPAND_FIXED)
         widget.setMinimumHeight(min_height)
 
     # -----------------------------
@@ -464,9 +372,11 @@ class MyChartLedgerKiosk(QWidget):
 # -------------------------------------------------------------------
 def main():
     app = QApplication(sys.argv)
+    # Room for the full-size decoded background image (KB).
+    QPixmapCache.setCacheLimit(20480)
 
-    # Initialize the backend
-    backend = LedgerBackend()
+    # Initialize the backend (shared with anything else in this process)
+    backend = get_backend()
 
     # (Optional) Seed the database with a user for testing:
     # backend.store_credentials("elder1", "elder1", "mypassword123")
@@ -1,8 +1,9 @@
 from flask import Flask, request, jsonify
-from ledger_backend import LedgerBackend  # Import your backend class
+from waitress import serve
+from ledger_backend import get_backend
 
 app = Flask(__name__)
-backend = LedgerBackend()
+backend = get_backend()
 
 @app.route('/api/store_credentials', methods=['POST'])
 def store_credentials():
@@ -24,7 +25,24 @@ def retrieve_credentials(user_id):
     if not creds:
         return jsonify({"error": "User not found"}), 404
 
-    return jsonify(creds), 200
+    response = jsonify(creds)
+    # Repeated lookups within a few seconds can be answered by the client.
+    response.headers['Cache-Control'] = 'private, max-age=5'
+    return response, 200
+
+@app.route('/api/retrieve_credentials_batch', methods=['POST'])
+def retrieve_credentials_batch():
+    data = request.json
+    user_ids = data.get('user_ids') if isinstance(data, dict) else None
+
+    if not isinstance(user_ids, list) or not user_ids or not all(isinstance(u, str) for u in user_ids):
+        return jsonify({"error": "user_ids must be a non-empty list of strings"}), 400
+
+    user_ids = list(dict.fromkeys(user_ids))
+    creds = backend.retrieve_credentials_many(user_ids)
+    missing = [user_id for user_id in user_ids if user_id not in creds]
+    return jsonify({"credentials": creds, "missing": missing}), 200
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # Multi-threaded WSGI server instead of the single-threaded dev server.
+    serve(app, host='127.0.0.1', port=5000, threads=16)
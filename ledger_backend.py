@@ -1,122 +1,412 @@
+import os
+import base64
+import functools
 import sqlite3
 import logging
-from cryptography.fernet import Fernet
+import threading
+import time
+from collections import OrderedDict
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
 import secrets
 from datetime import datetime, timedelta
 
+logging.basicConfig(level=logging.INFO)
+
+# SQL is kept as module-level constants so the same string objects are passed
+# on every call and sqlite3's per-connection statement cache keeps hitting.
+_SQL_CREATE = '''
+    CREATE TABLE IF NOT EXISTS user_credentials (
+        user_id TEXT PRIMARY KEY,
+        encrypted_username BLOB,
+        encrypted_password BLOB,
+        hint BLOB,
+        biometric_enabled INTEGER,
+        reset_token BLOB,
+        reset_expiry INTEGER
+    ) WITHOUT ROWID
+'''
+_SQL_PUT = '''
+    INSERT OR REPLACE INTO user_credentials (
+        user_id, encrypted_username, encrypted_password, hint, biometric_enabled
+    ) VALUES (?, ?, ?, ?, ?)
+'''
+_SQL_CREATE_META = '''
+    CREATE TABLE IF NOT EXISTS ledger_meta (
+        name TEXT PRIMARY KEY,
+        value BLOB
+    ) WITHOUT ROWID
+'''
+_SQL_GET_META = "SELECT value FROM ledger_meta WHERE name=?"
+_SQL_PUT_META = "INSERT OR IGNORE INTO ledger_meta (name, value) VALUES (?, ?)"
+_SQL_GET = '''
+    SELECT encrypted_username, encrypted_password, hint, biometric_enabled
+    FROM user_credentials WHERE user_id=?
+'''
+_SQL_GET_MANY = '''
+    SELECT user_id, encrypted_username, encrypted_password, hint, biometric_enabled
+    FROM user_credentials WHERE user_id IN ({placeholders})
+'''
+_SQL_GET_ALL_ENCRYPTED = "SELECT user_id, encrypted_username, encrypted_password, hint FROM user_credentials"
+# Only rewrites a row whose ciphertexts are still the ones rotation read, so
+# a store that lands mid-rotation is never overwritten with older data.
+_SQL_SET_ENCRYPTED = '''
+    UPDATE user_credentials SET encrypted_username=?, encrypted_password=?, hint=?
+    WHERE user_id=? AND encrypted_username=? AND encrypted_password=? AND hint=?
+'''
+_SQL_SET_RESET = "UPDATE user_credentials SET reset_token=?, reset_expiry=? WHERE user_id=?"
+_SQL_GET_RESET = "SELECT reset_token, reset_expiry FROM user_credentials WHERE user_id=?"
+_SQL_BEGIN = "BEGIN"
+_SQL_COMMIT = "COMMIT"
+_SQL_ROLLBACK = "ROLLBACK"
+# Columns added after the first release, for databases created before them.
+_ADDED_COLUMNS = (("reset_token", "BLOB"), ("reset_expiry", "INTEGER"))
+
+@functools.lru_cache(maxsize=None)
+def _sql_get_many(count):
+    """
+    One SQL string per IN (...) size, reused so it stays a statement-cache hit.
+    """
+    return _SQL_GET_MANY.format(placeholders=",".join("?" * count))
+
+# Ids per IN (...) query; stays below SQLITE_MAX_VARIABLE_NUMBER (999 on older builds).
+_MAX_BATCH = 500
+
+# AES-GCM nonce length; encrypted columns hold raw nonce || ciphertext || tag.
+_NONCE_SIZE = 12
+
+# Plaintexts at least this large are encrypted by _encrypt_stream's
+# preallocated-buffer path; below it the extra copy doesn't matter.
+_STREAM_MIN_SIZE = 64 * 1024
+
+# Scrypt parameters for deriving the key from LEDGER_PASSPHRASE (run once per start).
+_KDF_SALT_SIZE = 16
+_KDF_N, _KDF_R, _KDF_P = 2**15, 8, 1
+
+# Decrypted credentials are kept in memory for this long (seconds), for at
+# most this many users, so repeated lookups skip SQLite and AES-GCM.
+_CACHE_TTL = 30.0
+_CACHE_SIZE = 256
+
 class LedgerBackend:
     def __init__(self, db_path="secure_ledger.db"):
-        logging.basicConfig(level=logging.INFO)
-        self.logger = logging.getLogger("LedgerBackend")
+        self.logger = logging.getLogger(__name__)
 
-        self.key = Fernet.generate_key()
-        self.cipher_suite = Fernet(self.key)
         self.db_path = db_path
+
+        # One long-lived connection shared by every call (and every Flask
+        # worker thread), serialized through self._lock.
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # user_id -> (expires_at, creds)
+        self._cache_gen = 0  # bumped on every invalidate
+        self._cache_lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.executescript(
+            "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA temp_store=MEMORY;"
+        )
+        # Every statement goes through this one cursor (always under self._lock),
+        # with SQL strings from the module constants, so the connection's
+        # prepared-statement cache is hit instead of re-parsing each call.
+        self._cur = self._conn.cursor()
         self.setup_database()
 
+        # Resolved once per process; rows stay readable across restarts.
+        # LEDGER_KEY may list several comma-separated keys: the first one
+        # encrypts, older ones are only tried for decryption (key rotation).
+        key_b64 = os.environ.get("LEDGER_KEY")
+        if key_b64:
+            keyring = [base64.urlsafe_b64decode(k.strip()) for k in key_b64.split(",")]
+        else:
+            keyring = [self._bootstrap_key()]
+        if any(len(k) != 32 for k in keyring):
+            raise ValueError("LEDGER_KEY must be urlsafe-base64 encoded 32-byte keys")
+        self.key = keyring[0]
+        self._aeads = [AESGCM(k) for k in keyring]
+        self.aead = self._aeads[0]
+
     def setup_database(self):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS user_credentials (
-                user_id TEXT PRIMARY KEY,
-                encrypted_username TEXT,
-                encrypted_password TEXT,
-                hint TEXT,
-                biometric_enabled BOOLEAN
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        with self._lock:
+            self._cur.execute(_SQL_CREATE)
+            self._cur.execute(_SQL_CREATE_META)
+            columns = {row[1] for row in self._cur.execute("PRAGMA table_info(user_credentials)")}
+            for name, decl in _ADDED_COLUMNS:
+                if name not in columns:
+                    self._cur.execute(f"ALTER TABLE user_credentials ADD COLUMN {name} {decl}")
         self.logger.info("Database setup complete.")
 
+    def _bootstrap_key(self):
+        """
+        Derive the encryption key from LEDGER_PASSPHRASE with Scrypt, using a
+        salt persisted in ledger_meta. Without a passphrase, fall back to a
+        throwaway key (data will not survive a restart).
+        """
+        passphrase = os.environ.get("LEDGER_PASSPHRASE")
+        if not passphrase:
+            self.logger.warning(
+                "Neither LEDGER_KEY nor LEDGER_PASSPHRASE is set; using a temporary key."
+            )
+            return AESGCM.generate_key(bit_length=256)
+
+        with self._lock:
+            self._cur.execute(_SQL_PUT_META, ("kdf_salt", os.urandom(_KDF_SALT_SIZE)))
+            salt = self._cur.execute(_SQL_GET_META, ("kdf_salt",)).fetchone()[0]
+        kdf = Scrypt(salt=salt, length=32, n=_KDF_N, r=_KDF_R, p=_KDF_P)
+        return kdf.derive(passphrase.encode("utf-8"))
+
+    def _encrypt(self, plaintext):
+        nonce = os.urandom(_NONCE_SIZE)
+        return nonce + self.aead.encrypt(nonce, plaintext, None)
+
+    def _encrypt_stream(self, plaintext):
+        """
+        Same nonce || ciphertext || tag layout as _encrypt, but large values are
+        written with update_into into one preallocated buffer (returned as-is;
+        sqlite3 binds a bytearray as a BLOB), so they are not copied through
+        intermediate ciphertext objects. Small values go through _encrypt,
+        which is faster for them.
+        """
+        if len(plaintext) < _STREAM_MIN_SIZE:
+            return self._encrypt(plaintext)
+
+        nonce = os.urandom(_NONCE_SIZE)
+        encryptor = Cipher(algorithms.AES(self.key), modes.GCM(nonce)).encryptor()
+        # update_into needs len(plaintext) + block_size - 1 bytes of room.
+        buf = bytearray(_NONCE_SIZE + len(plaintext) + 15)
+        buf[:_NONCE_SIZE] = nonce
+        written = encryptor.update_into(plaintext, memoryview(buf)[_NONCE_SIZE:])
+        encryptor.finalize()
+        del buf[_NONCE_SIZE + written:]
+        buf += encryptor.tag
+        return buf
+
+    def _decrypt(self, blob):
+        return self._decrypt_with_index(blob)[0]
+
+    def _decrypt_with_index(self, blob):
+        """
+        Decrypt with the primary key, falling back to older keys in order.
+        Returns (plaintext, index of the key that worked).
+        """
+        nonce, data = blob[:_NONCE_SIZE], blob[_NONCE_SIZE:]
+        for index, aead in enumerate(self._aeads):
+            try:
+                return aead.decrypt(nonce, data, None), index
+            except InvalidTag:
+                continue
+        raise InvalidTag()
+
+    def _cache_get(self, user_id):
+        with self._cache_lock:
+            entry = self._cache.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._cache[user_id]
+                return None
+            self._cache.move_to_end(user_id)
+            return dict(entry[1])
+
+    def _cache_generation(self):
+        with self._cache_lock:
+            return self._cache_gen
+
+    def _cache_put(self, user_id, creds, generation):
+        with self._cache_lock:
+            # A write landed since the row was read: it may have been this
+            # user's, so don't risk caching stale data.
+            if self._cache_gen != generation:
+                return
+            self._cache[user_id] = (time.monotonic() + _CACHE_TTL, dict(creds))
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > _CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def _cache_invalidate(self, user_id):
+        with self._cache_lock:
+            self._cache_gen += 1
+            self._cache.pop(user_id, None)
+
+    def close(self):
+        """Close the shared database connection."""
+        with self._lock:
+            self._conn.close()
+
     def store_credentials(self, user_id, username, password, hint=""):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        enc_username = self.cipher_suite.encrypt(username.encode("utf-8"))
-        enc_password = self.cipher_suite.encrypt(password.encode("utf-8"))
-        c.execute('''
-            INSERT OR REPLACE INTO user_credentials (
-                user_id, encrypted_username, encrypted_password, hint, biometric_enabled
-            ) VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, enc_username, enc_password, hint, False))
-        conn.commit()
-        conn.close()
-        self.logger.info(f"Stored credentials for user: {user_id}")
+        enc_username = self._encrypt(username.encode("utf-8"))
+        enc_password = self._encrypt(password.encode("utf-8"))
+        enc_hint = self._encrypt_stream(hint.encode("utf-8"))
+        with self._lock:
+            self._cur.execute(_SQL_PUT, (user_id, enc_username, enc_password, enc_hint, False))
+        self._cache_invalidate(user_id)
+        self.logger.info("Stored credentials for user: %s", user_id)
+
+    def store_credentials_many(self, items):
+        """
+        Insert or replace many users at once from (user_id, username, password, hint)
+        tuples, in a single transaction.
+        """
+        rows = [
+            (
+                user_id,
+                self._encrypt(username.encode("utf-8")),
+                self._encrypt(password.encode("utf-8")),
+                self._encrypt_stream(hint.encode("utf-8")),
+                False
+            )
+            for user_id, username, password, hint in items
+        ]
+        with self._lock:
+            self._cur.execute(_SQL_BEGIN)
+            try:
+                self._cur.executemany(_SQL_PUT, rows)
+            except Exception:
+                self._cur.execute(_SQL_ROLLBACK)
+                raise
+            self._cur.execute(_SQL_COMMIT)
+        for row in rows:
+            self._cache_invalidate(row[0])
+        self.logger.info("Stored credentials for %d users", len(rows))
 
     def retrieve_credentials(self, user_id):
         """
         Retrieve decrypted username and password for a given user_id.
         Returns dict or None if not found.
         """
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute(
-            """SELECT encrypted_username, encrypted_password, hint, biometric_enabled
-               FROM user_credentials WHERE user_id=?""",
-            (user_id,)
-        )
-        row = c.fetchone()
-        conn.close()
+        cached = self._cache_get(user_id)
+        if cached is not None:
+            return cached
+
+        generation = self._cache_generation()
+        with self._lock:
+            row = self._cur.execute(_SQL_GET, (user_id,)).fetchone()
 
         if not row:
             return None
 
-        dec_username = self.cipher_suite.decrypt(row[0]).decode("utf-8")
-        dec_password = self.cipher_suite.decrypt(row[1]).decode("utf-8")
-        return {
+        dec_username = self._decrypt(row[0]).decode("utf-8")
+        dec_password = self._decrypt(row[1]).decode("utf-8")
+        creds = {
             "username": dec_username,
             "password": dec_password,
-            "hint": row[2],
+            "hint": self._decrypt(row[2]).decode("utf-8"),
             "biometric_enabled": row[3]
         }
+        self._cache_put(user_id, creds, generation)
+        return creds
+
+    def retrieve_credentials_many(self, user_ids):
+        """
+        Retrieve decrypted credentials for several user_ids at once.
+        Returns a dict keyed by user_id; unknown ids are simply absent.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        rows = []
+        with self._lock:
+            for i in range(0, len(user_ids), _MAX_BATCH):
+                chunk = user_ids[i:i + _MAX_BATCH]
+                rows.extend(self._cur.execute(_sql_get_many(len(chunk)), chunk).fetchall())
+
+        # Decrypted inline: a row is a few microseconds of AES-GCM on tiny
+        # values, less than a thread pool's hand-off costs (measured).
+        return dict(map(self._decrypt_row, rows))
+
+    def _decrypt_row(self, row):
+        decrypt = self._decrypt
+        return row[0], {
+            "username": decrypt(row[1]).decode("utf-8"),
+            "password": decrypt(row[2]).decode("utf-8"),
+            "hint": decrypt(row[3]).decode("utf-8"),
+            "biometric_enabled": row[4]
+        }
+
+    def rotate_credentials(self):
+        """
+        Re-encrypt, under the primary key, every row still encrypted with an
+        older key. Meant for an occasional background job; rows already on the
+        primary key, changed while rotation ran, or readable by no key are left
+        alone. Returns the number of rows rewritten.
+        """
+        with self._lock:
+            rows = self._cur.execute(_SQL_GET_ALL_ENCRYPTED).fetchall()
+
+        updates = []
+        for user_id, enc_username, enc_password, enc_hint in rows:
+            try:
+                (username, u_key), (password, p_key), (hint, h_key) = map(
+                    self._decrypt_with_index, (enc_username, enc_password, enc_hint)
+                )
+            except InvalidTag:
+                self.logger.warning("Cannot rotate %s: no key in the key ring decrypts it", user_id)
+                continue
+            if u_key == p_key == h_key == 0:
+                continue
+            updates.append((
+                self._encrypt(username),
+                self._encrypt(password),
+                self._encrypt_stream(hint),
+                user_id, enc_username, enc_password, enc_hint
+            ))
+        if not updates:
+            return 0
+
+        with self._lock:
+            self._cur.execute(_SQL_BEGIN)
+            try:
+                self._cur.executemany(_SQL_SET_ENCRYPTED, updates)
+                rotated = self._cur.rowcount
+            except Exception:
+                self._cur.execute(_SQL_ROLLBACK)
+                raise
+            self._cur.execute(_SQL_COMMIT)
+        self.logger.info("Rotated credentials for %d users", rotated)
+        return rotated
 
     def reset_password(self, user_id):
         """Generate a reset token and expiry for a user."""
         try:
-            # Confirm user exists
-            existing = self.retrieve_credentials(user_id)
-            if not existing:
-                self.logger.warning(f"No user found for {user_id}")
-                return None
-
             reset_token = secrets.token_urlsafe(32)
             expiry = datetime.now() + timedelta(hours=24)
-            # For demo, store token in 'hint' field. Not recommended for production.
-            conn = sqlite3.connect(self.db_path)
-            c = conn.cursor()
-            c.execute("UPDATE user_credentials SET hint=? WHERE user_id=?", (f"{reset_token}|{expiry}", user_id))
-            conn.commit()
-            conn.close()
+            # Expiry is stored as epoch seconds so verification needs no parsing.
+            # The UPDATE doubles as the existence check: no row, no match.
+            with self._lock:
+                self._cur.execute(
+                    _SQL_SET_RESET, (reset_token.encode("ascii"), int(expiry.timestamp()), user_id)
+                )
+                found = self._cur.rowcount > 0
+            if not found:
+                self.logger.warning("No user found for %s", user_id)
+                return None
 
             return {
                 "token": reset_token,
                 "expiry": expiry
             }
         except Exception as e:
-            self.logger.error(f"Password reset failed: {e}")
+            self.logger.error("Password reset failed: %s", e)
             return None
 
     def verify_reset_token(self, user_id, token):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute("SELECT hint FROM user_credentials WHERE user_id=?", (user_id,))
-        row = c.fetchone()
-        conn.close()
+        with self._lock:
+            row = self._cur.execute(_SQL_GET_RESET, (user_id,)).fetchone()
 
         if not row or not row[0]:
             return False
 
-        stored = row[0].split("|")
-        if len(stored) != 2:
-            return False
+        # Constant-time compare so the token cannot be guessed byte by byte.
+        return secrets.compare_digest(row[0], token.encode("utf-8")) and int(time.time()) < row[1]
+
+
+def get_backend(db_path="secure_ledger.db"):
+    """
+    Process-wide LedgerBackend for db_path, so every caller shares one
+    connection, key and credential cache.
+    """
+    # Different spellings of the same file must map to the same backend.
+    return _get_backend(os.path.abspath(db_path))
 
-        stored_token, expiry_str = stored
-        try:
-            expiry_time = datetime.fromisoformat(expiry_str)
-        except ValueError:
-            return False
 
-        if token == stored_token and datetime.now() < expiry_time:
-            return True
-        return False
+@functools.lru_cache(maxsize=None)
+def _get_backend(abs_db_path):
+    return LedgerBackend(abs_db_path)